@@ -7,7 +7,4 @@ control, and building.
 """
 
 __copyright__ = "Copyright (C) 2014 Ivan D Vasin"
-__credits__ = ["Ivan D Vasin"]
-__maintainer__ = "Ivan D Vasin"
-__email__ = "nisavid@gmail.com"
 __docformat__ = "restructuredtext"
@@ -2,10 +2,9 @@
 
 """Generate reStructuredText files for a project.
 
-This script generates all of the reST (reStructuredText) files for a
-project, overwriting existing ones.  It requires that the project is
-installed.  It inspects the project's module hierarchy, generating reST
-files as follows:
+This script generates the reST (reStructuredText) files for a project.
+It requires that the project is installed.  It inspects the project's
+module hierarchy, generating reST files as follows:
 
     * an :file:`index.rst` for the project that contains a table of
       contents with the project's top-level modules
@@ -41,6 +40,12 @@ import or a code structure that confuses the script---then the script
 will log the error, skip the failed part, and proceed with the other
 parts.
 
+The script records the state of the project's sources in the output
+directory.  On the next run, if neither the sources nor the script and
+its libraries have changed, and the previous run had no failures, the
+module files that already exist are left as they are.  Use
+:option:`--force` to regenerate all of them regardless.
+
 """
 
 __copyright__ = "Copyright (C) 2014 Ivan D Vasin"
@@ -49,12 +54,22 @@ __docformat__ = "restructuredtext"
 
 import abc as _abc
 import argparse as _argparse
+import errno as _errno
+import functools as _functools
+import json as _json
 import logging as _logging
+import multiprocessing as _multiprocessing
 import os as _os
+import pkg_resources as _pkg_resources
 import re as _re
 import runpy as _runpy
+import signal as _signal
 import sys as _sys
 import traceback as _traceback
+try:
+    import builtins as _builtins
+except ImportError:
+    import __builtin__ as _builtins
 
 import spruce.introspect as _introspect
 import spruce.pprint as _pprint
@@ -63,11 +78,8 @@ import spruce.pprint as _pprint
 def main():
 
     loglevel = _logging.WARNING
-    _logger.setLevel(level=loglevel)
-    _log_formatter = _logging.Formatter(_LOGGING_FORMAT)
-    _log_handler = _logging.StreamHandler()
-    _log_handler.setFormatter(_log_formatter)
-    _logger.addHandler(_log_handler)
+    _set_loglevel(loglevel)
+    _add_log_handler()
 
     try:
         args = _parse_args()
@@ -76,7 +88,7 @@ def main():
             loglevel = _logging.DEBUG
         else:
             loglevel = _LOGLEVELS_BY_ARGVALUE[args.loglevel]
-        _logger.setLevel(loglevel)
+        _set_loglevel(loglevel)
 
         _run(args)
     except _CriticalError as exc:
@@ -84,52 +96,120 @@ def main():
         _sys.exit(1)
 
 
-def _ensure_project_output_dirs(docspec):
+def _add_log_handler():
+    log_formatter = _logging.Formatter(_LOGGING_FORMAT)
+    log_handler = _logging.StreamHandler()
+    log_handler.setFormatter(log_formatter)
+    _logger.addHandler(log_handler)
+
+
+def _doc_module_attr(output, docspec, attrname, level=1):
+
+    # determine directive
+    attr = docspec.module_attr(attrname)
+    try:
+        metatype = attr.metatype
+    except (AttributeError, ImportError, _introspect.InvalidObject) as exc:
+        _log_failed_module_attr(docspec.name, attrname,
+                                message=_format_exc(exc))
+        return
+    directive = _DIRECTIVES_BY_METATYPE.get(metatype)
+    if directive is None:
+        if metatype == _introspect.Metatype.MODULE:
+            # FIXME: inspect import
+            if _module_path_isstandard(attr.name):
+                _log_skipped_module_attr(docspec.name, attrname,
+                                         'it is a standard module')
+                return
+            else:
+                try:
+                    _introspect.module_from_object(attr).pyobject()
+                except ImportError:
+                    directive = 'autodata'
+                else:
+                    directive = 'automodule'
+        else:
+            _logger.warning('cannot determine metatype of attribute {} of'
+                             ' module {}; falling back to treating it as a'
+                             ' generic object'
+                             .format(attrname, docspec))
+            directive = 'autodata'
+
+    # document attribute
+    output.extend(_rest_heading_lines(attrname, level=(level + 1)))
+    output.append('.. {}:: {}.{}'.format(directive, docspec.name, attrname))
+    if directive in _AUTODOC_MEMBERS_DIRECTIVES:
+        output.extend(_AUTODOC_MEMBERS_FLAGS_LINES)
+    output.append('')
+
+
+def _doc_module_attrs(output, docspec, level=1, module_isincluded=False):
 
-    def raise_error(message):
-        raise _CriticalError('failed to create directory {!r}: {}'
-                              .format(docspec.out_parentdirpath, message))
+    # FIXME: exclude attrs already documented in module docstring
 
-    def raise_notdir_error(file):
-        raise_error('not a directory: {!r}'.format(file))
+    try:
+        attrnames = docspec.module_attrnames
+    except Exception as exc:
+        _log_failed_module_attrs(docspec.name, message=_format_exc(exc))
+        return
+
+    try:
+        included_modules_docspecs = docspec.included_modules_docspecs
+        descendants_included_modules_docspecs = \
+            docspec.descendants_included_modules_docspecs
+    except IOError:
+        included_modules_docspecs = []
+        descendants_included_modules_docspecs = []
+    attrnames = [attrname for attrname in attrnames
+                 if _should_doc_module_attr
+                     (docspec, attrname, included_modules_docspecs,
+                      descendants_included_modules_docspecs,
+                      module_isincluded=module_isincluded)]
+    # break ties between names that differ only in case, since the names
+    # come from a set, in no particular order
+    attrnames.sort(key=(lambda name: (name.lower(), name)))
+    if attrnames and _info_enabled:
+        _logger.info('documenting attributes of {}: {}'
+                      .format(docspec, ', '.join(attrnames)))
+    for attrname in attrnames:
+        _doc_module_attr(output, docspec, attrname, level=level)
+
+
+def _ensure_project_output_dirs(docspec):
 
-    project_out_dirpath = _os.path.dirname(docspec.out_filepath)
-    if not _os.path.exists(project_out_dirpath):
+    # every directory that will contain a file; creating only the deepest
+    # ones creates the rest along the way
+    dirname = _os.path.dirname
+    dirpaths = set(dirname(docspec_.out_filepath)
+                   for docspec_ in [docspec] + docspec.descendants)
+    ancestor_dirpaths = set()
+    for dirpath in dirpaths:
+        dirpath = dirname(dirpath)
+        while dirpath and dirpath not in ancestor_dirpaths:
+            ancestor_dirpaths.add(dirpath)
+            dirpath = dirname(dirpath)
+
+    for dirpath in sorted(dirpaths - ancestor_dirpaths):
         try:
-            _os.makedirs(project_out_dirpath)
+            _os.makedirs(dirpath)
         except OSError as exc:
-            match = _re.search(r'Not a directory: \'(.*)\'', str(exc))
-            if match:
-                filepath = match.group(1)
-                if _os.path.sep in filepath:
-                    filepath = _os.path.dirname(filepath)
-                raise_notdir_error(filepath=filepath)
-            else:
-                raise_error(exc)
-    elif not _os.path.isdir(project_out_dirpath):
-        raise_notdir_error(filepath=project_out_dirpath)
-
-    def ensure_child_output_dirs(docspec, parentdirpath):
-        if not docspec.children:
-            return
-        dirpath = _os.path.join(parentdirpath, docspec.shortname)
-        if not _os.path.exists(dirpath):
-            try:
-                _os.mkdir(dirpath)
-            except OSError as exc:
-                raise_error(exc)
-        elif not _os.path.isdir(dirpath):
-            raise_notdir_error(filepath=dirpath)
-        for child_docspec in docspec.children:
-            ensure_child_output_dirs(child_docspec, dirpath)
+            if exc.errno == _errno.EEXIST and _os.path.isdir(dirpath):
+                continue
 
-    for child_docspec in docspec.children:
-        ensure_child_output_dirs(child_docspec, docspec.out_parentdirpath)
+            if exc.errno == _errno.EEXIST:
+                message = 'not a directory: {!r}'.format(exc.filename)
+            elif exc.errno == _errno.ENOTDIR:
+                message = 'not a directory: {!r}'\
+                           .format(_os.path.dirname(exc.filename))
+            else:
+                message = exc
+            raise _CriticalError('failed to create directory {!r}: {}'
+                                  .format(dirpath, message))
 
 
 def _format_exc(exc, limit=None):
     message = str(exc)
-    if _logger.isEnabledFor(_logging.DEBUG):
+    if _debug_enabled:
         message += '\n' + _traceback.format_exc(limit=limit)
     return message
 
@@ -138,185 +218,107 @@ def _generate_module_rest(docspec, pretend=False):
 
     output = []
 
-    def doc_module_docspec(docspec, level=1, titlefunc=None,
-                           module_isincluded=False):
-
-        _logger.info('documenting module {}'.format(docspec.name))
+    if pretend:
+        output.append('')
+        docpath = _os.path.sep.join(docspec.name.split('.'))
+        output.append('{}.rst'.format(docpath))
+        output.append('----')
 
-        # FIXME: exclude attrs already documented in module docstring
+    output.extend(_REST_FILE_HEADER_LINES)
 
-        def doc_module_attr(attrname):
+    # included modules are documented inline, depth first, right after the
+    # module that includes them
+    stack = [(docspec, 1, (lambda docspec: docspec.name), False)]
+    while stack:
+        docspec_, level, titlefunc, module_isincluded = stack.pop()
 
-            def log_failed(exc):
-                _log_failed_module_attr(docspec.name, attrname,
-                                        message=_format_exc(exc))
-
-            # determine directive
-            attr = docspec.module_attr(attrname)
-            try:
-                metatype = attr.metatype
-            except (AttributeError, ImportError, _introspect.InvalidObject) \
-                   as exc:
-                log_failed(exc)
-                return
-            if metatype == _introspect.Metatype.OLDSTYLE:
-                directive = 'autodata'
-            elif metatype == _introspect.Metatype.FUNCTION:
-                directive = 'autofunction'
-            elif metatype == _introspect.Metatype.CLASS:
-                directive = 'autoclass'
-            elif metatype == _introspect.Metatype.EXCEPTION:
-                directive = 'autoexception'
-            elif metatype == _introspect.Metatype.MODULE:
-                # FIXME: inspect import
-                if _introspect.module_path_isstandard(attr.name):
-                    _log_skipped_module_attr(docspec.name, attrname,
-                                             'it is a standard module')
-                    return
-                else:
-                    try:
-                        _introspect.module_from_object(attr).pyobject()
-                    except ImportError:
-                        directive = 'autodata'
-                    else:
-                        directive = 'automodule'
-            else:
-                _logger.warning('cannot determine metatype of attribute {} of'
-                                 ' module {}; falling back to treating it as a'
-                                 ' generic object'
-                                 .format(attrname, docspec))
-                directive = 'autodata'
-
-            # document attribute
-            output.extend(_rest_heading_lines(attrname, level=(level + 1)))
-            output.append('.. {}:: {}.{}'.format(directive, docspec.name,
-                                                 attrname))
-            if directive in ['automodule', 'autoclass', 'autoexception']:
-                autodoc_members_flags = ['members', 'undoc-members',
-                                         'inherited-members']
-                for flag in autodoc_members_flags:
-                    output.append('   :{}:'.format(flag))
-            output.append('')
-
-        def doc_module_attrs():
-            try:
-                attrnames = docspec.module_attrnames
-            except Exception as exc:
-                _log_failed_module_attrs(docspec.name,
-                                         message=_format_exc(exc))
-            else:
-                attrnames = [attrname for attrname in attrnames
-                             if _should_doc_module_attr(docspec, attrname,
-                                                        module_isincluded=
-                                                            module_isincluded)]
-                attrnames.sort(key=(lambda name: name.lower()))
-                if attrnames:
-                    _logger.info('documenting attributes of {}: {}'
-                                  .format(docspec,
-                                          ', '.join(attrname
-                                                    for attrname
-                                                    in attrnames)))
-                for attrname in attrnames:
-                    doc_module_attr(attrname)
+        _logger.info('documenting module %s', docspec_.name)
 
         # determine title
-        default_titlefunc = lambda docspec: docspec.name
-        if not titlefunc:
-            titlefunc = default_titlefunc
         try:
-            title = titlefunc(docspec)
+            title = titlefunc(docspec_)
             title = title.rstrip('.')
         except:
             title = ''
         if not title:
-            title = default_titlefunc(docspec)
+            title = docspec_.name
 
         # document title and docstring
         output.extend(_rest_heading_lines(title, level=level))
-        output.append('.. automodule:: {}'.format(docspec.name))
+        output.append('.. automodule:: {}'.format(docspec_.name))
         output.append('')
         output.append('')
 
         # document children
         if not module_isincluded:
-            children = list(docspec.children)
-            children = [child for child in children
+            children = [child for child in docspec_.children
                         if _should_doc_module_docspec(child)]
             children.sort(key=(lambda docspec: docspec.name.lower()))
             if children:
-                _logger.info('documenting children of {}: {}'
-                              .format(docspec,
-                                      ', '.join(str(child)
-                                                for child in children)))
+                if _info_enabled:
+                    _logger.info('documenting children of {}: {}'
+                                  .format(docspec_,
+                                          ', '.join(str(child)
+                                                    for child in children)))
                 output.extend(_rest_heading_lines('Submodules',
                                                   level=(level + 1)))
                 output.append('.. toctree::')
                 output.append('')
                 for child in children:
-                    assert child.name.startswith(docspec.name)
+                    assert child.name.startswith(docspec_.name)
                     output.append('   {}'.format(child.reldocpath))
                 output.append('')
                 output.append('')
 
         # document attributes
-        doc_module_attrs()
+        _doc_module_attrs(output, docspec_, level=level,
+                          module_isincluded=module_isincluded)
 
         # document included modules
         try:
-            included_modules_docspecs = list(docspec.included_modules_docspecs)
-        except (_introspect.InconsistentStructure, IOError) as exc:
-            _log_failed_included_modules(docspec, message=_format_exc(exc))
-        else:
             included_modules_docspecs = \
-                [docspec_ for docspec_ in included_modules_docspecs
-                 if _should_doc_module_docspec(docspec_,
-                                               module_isincluded=True)]
-            included_modules_docspecs.sort(key=(lambda docspec:
-                                                    docspec.name.lower()))
-            if included_modules_docspecs:
-                _logger.info('documenting modules included in {}: {}'
-                              .format(docspec,
-                                      ', '.join(str(included_docspec)
-                                                for included_docspec
-                                                in included_modules_docspecs)))
-            for included_module_docspec in included_modules_docspecs:
-                doc_module_docspec(included_module_docspec,
-                                   level=(level + 1),
-                                   titlefunc=(lambda docspec:
-                                                  docspec.shortdoc),
-                                   module_isincluded=True)
-
-    if pretend:
-        output.append('')
-        docpath = _os.path.sep.join(docspec.name.split('.'))
-        output.append('{}.rst'.format(docpath))
-        output.append('----')
-
-    output.extend(_rest_file_header_lines(docspec))
-    doc_module_docspec(docspec, titlefunc=(lambda docspec: docspec.name))
+                list(docspec_.included_modules_docspecs)
+        except (_introspect.InconsistentStructure, IOError) as exc:
+            _log_failed_included_modules(docspec_, message=_format_exc(exc))
+            continue
+        included_modules_docspecs = \
+            [included_docspec for included_docspec in included_modules_docspecs
+             if _should_doc_module_docspec(included_docspec,
+                                           module_isincluded=True)]
+        included_modules_docspecs.sort(key=(lambda docspec:
+                                                docspec.name.lower()))
+        if included_modules_docspecs and _info_enabled:
+            _logger.info('documenting modules included in {}: {}'
+                          .format(docspec_,
+                                  ', '.join(str(included_docspec)
+                                            for included_docspec
+                                            in included_modules_docspecs)))
+        stack.extend((included_docspec, level + 1,
+                      (lambda docspec: docspec.shortdoc), True)
+                     for included_docspec
+                     in reversed(included_modules_docspecs))
 
     if pretend:
         output.append('----')
         output.append('')
 
-    if pretend:
-        file_ = _sys.stdout
-    else:
-        file_ = open(docspec.out_filepath, 'w')
+    _write_lines(output, docspec.out_filepath, pretend=pretend)
 
-    for line in output:
-        print >> file_, line
 
-    if not pretend:
-        file_.close()
+def _generate_module_rest_in_worker(module_path):
+    # the introspection objects that the docspecs cache cannot be pickled,
+    # so each worker builds its own project docspec and finds the module's
+    # docspec in it
+    _generate_module_rest(_worker_project_docspec.descendant(module_path))
+    return _parts_failed
 
 
 def _generate_project_toplevel_rest(docspec, pretend=False):
 
-    _logger.info('documenting project {}'.format(docspec.name))
+    _logger.info('documenting project %s', docspec.name)
 
     output = []
-    output.extend(_rest_file_header_lines(docspec))
+    output.extend(_REST_FILE_HEADER_LINES)
     output.append('`up to project list <../../>`_')
     output.append('')
     output.extend(_rest_heading_lines(docspec.name))
@@ -330,12 +332,12 @@ def _generate_project_toplevel_rest(docspec, pretend=False):
         output.extend(_rest_heading_lines('Modules', level=2))
         output.append('.. toctree::')
         output.append('')
+        join_path = _os.path.join
+        sep = _os.path.sep
         for module_docspec in descendants:
-            module_rest_docpath = module_docspec.name.replace('.',
-                                                              _os.path.sep)
+            module_rest_docpath = module_docspec.name.replace('.', sep)
             if module_docspec.children:
-                module_rest_docpath = _os.path.join(module_rest_docpath,
-                                                    'index')
+                module_rest_docpath = join_path(module_rest_docpath, 'index')
             output.append('   {}'.format(module_rest_docpath))
         output.append('')
         output.append('')
@@ -345,25 +347,107 @@ def _generate_project_toplevel_rest(docspec, pretend=False):
     output.append('* :ref:`modindex`')
     output.append('* :ref:`search`')
 
-    if pretend:
-        file_ = _sys.stdout
-    else:
-        filepath = _os.path.join(docspec.out_parentdirpath, 'index.rst')
-        file_ = open(filepath, 'w')
+    _write_lines(output,
+                 _os.path.join(docspec.out_parentdirpath, 'index.rst'),
+                 pretend=pretend)
 
-    for line in output:
-        print >> file_, line
 
-    if not pretend:
-        file_.close()
+def _generate_project_rests(docspec, args):
 
+    _generate_project_toplevel_rest(docspec, pretend=args.pretend)
 
-def _generate_project_rests(docspec, pretend=False):
-    _generate_project_toplevel_rest(docspec, pretend=pretend)
-    for module_docspec in docspec.descendants:
-        if module_docspec.skip:
-            continue
-        _generate_module_rest(module_docspec, pretend=pretend)
+    modules_docspecs = [module_docspec
+                        for module_docspec in docspec.descendants
+                        if not module_docspec.skip]
+
+    # skip the modules whose files were already generated, if no source in
+    # the project has changed since the last run---a module's file can
+    # depend on any of its descendants and on anything that it imports, so
+    # a change anywhere regenerates every module
+    if not args.pretend:
+        manifest_filepath = _os.path.join(docspec.out_parentdirpath,
+                                          _MANIFEST_FILENAME)
+        sources_stamp = _project_sources_stamp(docspec)
+        if not args.force and sources_stamp is not None \
+               and sources_stamp == _read_manifest(manifest_filepath):
+            stale_modules_docspecs = []
+            for module_docspec in modules_docspecs:
+                if _os.path.exists(module_docspec.out_filepath):
+                    _log_skipped_module(module_docspec.name,
+                                        reason='the project is unchanged'
+                                                ' since the last run')
+                else:
+                    stale_modules_docspecs.append(module_docspec)
+            modules_docspecs = stale_modules_docspecs
+
+    # generate the modules' files in parallel only when writing them---the
+    # pretend output goes to stdout, where it would be interleaved
+    workers = min(args.workers, len(modules_docspecs))
+    if workers > 1 and not args.pretend:
+        # hand the workers the included modules that are already known here,
+        # so that they need not re-derive them for each module's ancestors
+        included_modules_paths = \
+            dict((module_docspec.src_filepath,
+                  module_docspec.known_included_modules_paths)
+                 for module_docspec in docspec.descendants
+                 if module_docspec.known_included_modules_paths is not None)
+        pool = _multiprocessing.Pool(workers, initializer=_init_worker,
+                                     initargs=(args, _logger.level,
+                                               included_modules_paths))
+        try:
+            # wait with a timeout---on Python 2, an untimed wait cannot be
+            # interrupted, so Ctrl-C would hang the parent
+            workers_parts_failed = \
+                pool.map_async(_generate_module_rest_in_worker,
+                               [module_docspec.name
+                                for module_docspec in modules_docspecs],
+                               chunksize=max(1, len(modules_docspecs)
+                                                 // (4 * workers)))\
+                    .get(_POOL_RESULTS_TIMEOUT)
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+    else:
+        workers_parts_failed = []
+        for module_docspec in modules_docspecs:
+            _generate_module_rest(module_docspec, pretend=args.pretend)
+
+    if not args.pretend:
+        # files with failed parts must be regenerated next time, even if the
+        # sources are unchanged---the failure may have been due to something
+        # else, such as a missing dependency
+        if _parts_failed or any(workers_parts_failed):
+            sources_stamp = None
+        _write_manifest(manifest_filepath, sources_stamp)
+
+
+def _generator_stamp():
+    # regenerate everything whenever this script or the libraries that
+    # determine the modules' attributes and structure change
+    versions = []
+    for dist_name in _LIBS_DISTS_NAMES:
+        try:
+            version = _pkg_resources.get_distribution(dist_name).version
+        except _pkg_resources.DistributionNotFound:
+            version = None
+        versions.append([dist_name, version])
+    return [_os.path.getmtime(_os.path.abspath(__file__)), versions]
+
+
+def _init_worker(args, loglevel, included_modules_paths):
+    global _worker_project_docspec
+    # leave handling Ctrl-C to the parent, which terminates the pool
+    _signal.signal(_signal.SIGINT, _signal.SIG_IGN)
+    if not _logger.handlers:
+        _add_log_handler()
+    _set_loglevel(loglevel)
+    _worker_project_docspec = _project_docspec(args)
+    _worker_project_docspec.known_included_modules_paths\
+     .update(included_modules_paths)
 
 
 def _log_failed_included_modules(module_path, message):
@@ -397,21 +481,43 @@ def _log_failed_module_attrs(module_path, message, attrnames=None):
 
 
 def _log_failed_part(part, message):
-    _logger.error('failed to document {}: {}'.format(part, message))
+    global _parts_failed
+    _parts_failed = True
+    _logger.error('failed to document %s: %s', part, message)
 
 
 def _log_skipped_module(module_path, reason):
-    _log_skipped_part('module {}'.format(module_path), reason=reason)
+    if _debug_enabled:
+        _log_skipped_part('module {}'.format(module_path), reason=reason)
 
 
 def _log_skipped_module_attr(module_path, attrname, reason):
-    _log_skipped_part('attribute {} of module {}'
-                       .format(attrname, module_path),
-                      reason=reason)
+    # this is called for most attributes of every module, so don't bother
+    # describing the attribute unless the message will be emitted
+    if _debug_enabled:
+        _log_skipped_part('attribute {} of module {}'
+                           .format(attrname, module_path),
+                          reason=reason)
 
 
 def _log_skipped_part(part, reason):
-    _logger.debug('skipping {} because {}'.format(part, reason))
+    _logger.debug('skipping %s because %s', part, reason)
+
+
+def _memoized(func):
+
+    cache = {}
+
+    @_functools.wraps(func)
+    def memoized_func(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = func(*args, **kwargs)
+            return value
+
+    return memoized_func
 
 
 def _parse_args():
@@ -428,6 +534,9 @@ def _parse_args():
                         help='top-level module names that should be excluded;'
                               ' default is {}'
                               .format(' '.join(default_excluded_modules)))
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='regenerate every file, even if the project\'s'
+                              ' sources are unchanged since the last run')
     parser.add_argument('--loglevel', choices=_LOGLEVELS_BY_ARGVALUE.keys(),
                         default='warning', help='the logging level')
     parser.add_argument('-o', '--output', default=_os.path.join('.', 'doc'),
@@ -441,119 +550,162 @@ def _parse_args():
                         help='a relative path to the project\'s source code'
                               ' directory; default is {}'
                               .format(' '.join(default_src)))
+    parser.add_argument('-j', '--workers', type=int,
+                        default=_multiprocessing.cpu_count(),
+                        help='the number of processes that generate module'
+                              ' files in parallel; 1 generates them serially;'
+                              ' default is %(default)s')
     return parser.parse_args()
 
 
-def _rest_file_header_lines(docspec):
-    header = []
-    header.append('.. highlight:: python')
-    header.append('   :linenothreshold: 5')
-    header.append('')
-    return header
+def _project_docspec(args):
+    project_docspec = _ProjectDocSpec(args.path, args.output,
+                                      src_dirnames=args.src)
+    project_docspec.excluded_modules_names.extend(args.excluded_modules)
+    return project_docspec
+
+
+def _project_sources_stamp(docspec):
+
+    # the paths and modification times of all of the project's Python
+    # sources, along with the options that select its modules
+
+    out_dirpath = _os.path.realpath(docspec.out_parentdirpath)
+    join_path = _os.path.join
+    getmtime = _os.path.getmtime
+    files = []
+    for src_dirname in docspec.src_dirnames:
+        src_dirpath = join_path(docspec.src_filepath, src_dirname)
+        for dirpath, dirnames, filenames in _os.walk(src_dirpath):
+            dirnames[:] = \
+                [dirname for dirname in dirnames
+                 if not dirname.startswith('.')
+                    and _os.path.realpath(join_path(dirpath, dirname))
+                        != out_dirpath]
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    filepath = join_path(dirpath, filename)
+                    try:
+                        files.append([filepath, getmtime(filepath)])
+                    except OSError:
+                        return None
+    files.sort()
+    return {'excluded_modules': sorted(docspec.excluded_modules_names),
+            'files': files,
+            'src': list(docspec.src_dirnames),
+            }
+
+
+def _read_manifest(filepath):
+    try:
+        with open(filepath, 'r') as file_:
+            manifest = _json.load(file_)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) \
+           or manifest.get('generator') != _generator_stamp():
+        return {}
+    return manifest.get('sources')
 
 
+@_memoized
 def _rest_heading_lines(text, level=1):
 
     assert level >= 1
 
-    if level == 1:
-        line_char = '#'
-    elif level == 2:
-        line_char = '*'
-    elif level == 3:
-        line_char = '='
-    elif level == 4:
-        line_char = '-'
-    elif level == 5:
-        line_char = '^'
-    elif level == 6:
-        line_char = '"'
+    if level <= len(_REST_HEADING_CHARS):
+        line_char = _REST_HEADING_CHARS[level - 1]
     else:
         line_char = '+'
 
     line = line_char * len(text)
-    return [line, text, line]
+    return (line, text, line)
 
 
 def _run(args):
-    project_docspec = _ProjectDocSpec(args.path, args.output,
-                                      src_dirnames=args.src)
-    project_docspec.excluded_modules_names.extend(args.excluded_modules)
+    if args.workers < 1:
+        raise _CriticalError('invalid number of workers {!r}'
+                              .format(args.workers))
+    project_docspec = _project_docspec(args)
     if not args.pretend:
         _ensure_project_output_dirs(project_docspec)
-    _generate_project_rests(project_docspec, pretend=args.pretend)
+    _generate_project_rests(project_docspec, args)
 
 
-def _should_doc_module_docspec(docspec, module_isincluded=False):
+def _set_loglevel(loglevel):
+    global _debug_enabled, _info_enabled
+    _logger.setLevel(loglevel)
+    _debug_enabled = _logger.isEnabledFor(_logging.DEBUG)
+    _info_enabled = _logger.isEnabledFor(_logging.INFO)
+
 
-    def log_skip(reason):
-        _log_skipped_module(docspec.name, reason=reason)
+def _should_doc_module_docspec(docspec, module_isincluded=False):
 
     if not module_isincluded:
         if docspec.module_isprivate:
-            log_skip(reason='it is private')
+            _log_skipped_module(docspec.name, reason='it is private')
             return False
 
         if docspec.module_isstandard:
-            log_skip(reason='it is in the Python standard library')
+            _log_skipped_module(docspec.name,
+                                reason='it is in the Python standard library')
             return False
 
     return True
 
 
-def _should_doc_module_attr(module_docspec, attrname, module_isincluded=False):
+def _should_doc_module_attr(module_docspec, attrname,
+                            included_modules_docspecs,
+                            descendants_included_modules_docspecs,
+                            module_isincluded=False):
 
     module_path = module_docspec.name
 
-    def log_skip(reason):
-        _log_skipped_module_attr(module_path, attrname, reason=reason)
-
-    if attrname in dir(__builtins__):
-        log_skip(reason='it is a built-in')
+    if attrname in _BUILTIN_NAMES:
+        _log_skipped_module_attr(module_path, attrname,
+                                 reason='it is a built-in')
         return False
 
     if attrname.startswith('_'):
-        log_skip(reason='it is private')
+        _log_skipped_module_attr(module_path, attrname,
+                                 reason='it is private')
         return False
     if attrname == 'extension':
-        log_skip(reason='it is defined for all modules')
+        _log_skipped_module_attr(module_path, attrname,
+                                 reason='it is defined for all modules')
         return False
 
-    try:
-        included_modules_docspecs = \
-            list(module_docspec.included_modules_docspecs)
-        descendants_included_modules_docspecs = \
-            list(module_docspec.descendants_included_modules_docspecs)
-    except IOError:
-        pass
-    else:
-        for included_module_docspec in included_modules_docspecs:
-            if included_module_docspec.parent == module_docspec \
-                   and attrname == included_module_docspec.shortname:
-                log_skip(reason='it is an included module')
-                return False
-
-        # skip attributes defined in included modules
-        # FIXME: do not skip attributes that are defined in included modules
-        #     only by being imported from a higher-up module
-        for included_module_docspec \
-                in included_modules_docspecs \
-                   + descendants_included_modules_docspecs:
-            try:
-                included_module_attrnames = \
-                    included_module_docspec.module_attrnames
-            except (AttributeError, ImportError, _introspect.InvalidObject):
-                continue
-            if attrname in included_module_attrnames:
-                log_skip(reason='it will be documented as part of the included'
-                                 ' module {}'
-                                 .format(included_module_docspec.name))
-                return False
+    for included_module_docspec in included_modules_docspecs:
+        if included_module_docspec.parent == module_docspec \
+               and attrname == included_module_docspec.shortname:
+            _log_skipped_module_attr(module_path, attrname,
+                                     reason='it is an included module')
+            return False
+
+    # skip attributes defined in included modules
+    # FIXME: do not skip attributes that are defined in included modules
+    #     only by being imported from a higher-up module
+    for included_module_docspec \
+            in included_modules_docspecs \
+               + descendants_included_modules_docspecs:
+        try:
+            included_module_attrnames = \
+                included_module_docspec.module_attrnames
+        except (AttributeError, ImportError, _introspect.InvalidObject):
+            continue
+        if attrname in included_module_attrnames:
+            _log_skipped_module_attr(module_path, attrname,
+                                     reason='it will be documented as part'
+                                             ' of the included module {}'
+                                             .format(included_module_docspec
+                                                      .name))
+            return False
 
     if not module_isincluded:
         if any(attrname == child.shortname
                for child in module_docspec.children):
-            log_skip(reason='it is a submodule')
+            _log_skipped_module_attr(module_path, attrname,
+                                     reason='it is a submodule')
             return False
 
     # FIXME: skip attributes of standard modules
@@ -561,6 +713,46 @@ def _should_doc_module_attr(module_docspec, attrname, module_isincluded=False):
     return True
 
 
+def _write_lines(lines, filepath, pretend=False):
+
+    text = '\n'.join(lines) + '\n'
+
+    if pretend:
+        _sys.stdout.write(text)
+        return
+
+    # write the encoded text straight to the file descriptor, bypassing the
+    # buffered file layers; a regular file normally takes it in one write
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    data = memoryview(text)
+
+    # write to a temporary file and move it into place, so that an
+    # interrupted run never leaves a truncated file behind
+    tmp_filepath = '{}.tmp.{}'.format(filepath, _os.getpid())
+    fd = _os.open(tmp_filepath, _os.O_WRONLY | _os.O_CREAT | _os.O_TRUNC,
+                  0o666)
+    try:
+        try:
+            while data:
+                data = data[_os.write(fd, data):]
+        finally:
+            _os.close(fd)
+        _replace_file(tmp_filepath, filepath)
+    except:
+        try:
+            _os.remove(tmp_filepath)
+        except OSError:
+            pass
+        raise
+
+
+def _write_manifest(filepath, sources_stamp):
+    manifest = {'generator': _generator_stamp(), 'sources': sources_stamp}
+    _write_lines((_json.dumps(manifest, indent=1, sort_keys=True),),
+                 filepath)
+
+
 class _DocSpec(object):
 
     __metaclass__ = _abc.ABCMeta
@@ -587,11 +779,16 @@ class _DocSpec(object):
 
     @property
     def descendants(self):
-        if not self._descendants:
+        if self._descendants is None:
+            # walk the tree in preorder with an explicit stack, rather than
+            # concatenating each child's descendants, so that every docspec
+            # is visited once
             descendants = []
-            for child in self.children:
-                descendants.append(child)
-                descendants.extend(child.descendants)
+            stack = list(reversed(self.children))
+            while stack:
+                docspec = stack.pop()
+                descendants.append(docspec)
+                stack.extend(reversed(docspec.children))
             self._descendants = descendants
         return self._descendants
 
@@ -601,6 +798,17 @@ class _DocSpec(object):
                                          self.root.out_parentdirpath)
         return _os.path.normpath(_os.path.join(parentdocpath, self.reldocpath))
 
+    def descendant(self, name):
+        for child in self.children:
+            if child.name == name:
+                return child
+            if name.startswith(child.name + '.'):
+                try:
+                    return child.descendant(name)
+                except KeyError:
+                    pass
+        raise KeyError(name)
+
     @_abc.abstractproperty
     def docstring(self):
         pass
@@ -679,12 +887,12 @@ class _DocSpec(object):
     @property
     def _ancestor_included_modulepaths(self):
         if self._ancestor_included_modulepaths_ is None:
-            self._ancestor_included_modulepaths_ = []
-            ancestor = self.parent
-            while ancestor:
-                self._ancestor_included_modulepaths_ += \
-                    ancestor.included_modules_paths
-                ancestor = ancestor.parent
+            if self.parent:
+                self._ancestor_included_modulepaths_ = \
+                    self.parent._ancestor_included_modulepaths \
+                    + tuple(self.parent.included_modules_paths)
+            else:
+                self._ancestor_included_modulepaths_ = ()
         return self._ancestor_included_modulepaths_
 
 
@@ -697,6 +905,9 @@ class _ModuleDocSpec(_DocSpec):
         self._descendants_included_modules_docspecs = None
         self._included_modules_paths = None
         self._included_modules_docspecs = None
+        self._module_attrnames = None
+        self._module_isprivate = None
+        self._module_isstandard = None
         self._module_ = None
         self.skip = False
 
@@ -704,16 +915,18 @@ class _ModuleDocSpec(_DocSpec):
     def children(self):
         if self._children is None:
             if self._module.ispackage:
+                # submodules that are included here or in an ancestor are
+                # documented as part of the including module
+                included_modulepaths = \
+                    frozenset(self.included_modules_paths)\
+                     .union(self._ancestor_included_modulepaths)
+                out_dirpath = _os.path.join(self.out_parentdirpath,
+                                            self.shortname)
                 self._children = \
-                    [_ModuleDocSpec(module.filepath,
-                                    _os.path.join(self.out_parentdirpath,
-                                                  self.shortname),
-                                    parent=self)
+                    [_ModuleDocSpec(module.filepath, out_dirpath, parent=self)
                      for module
                      in self._module.submodules(include_packages=True)
-                     if module.path not in self.included_modules_paths
-                        and module.path
-                            not in self._ancestor_included_modulepaths]
+                     if module.path not in included_modulepaths]
             else:
                 self._children = []
         return self._children
@@ -738,46 +951,68 @@ class _ModuleDocSpec(_DocSpec):
 
     @property
     def included_modules_docspecs(self):
-        for path in self.included_modules_paths:
-            try:
-                module = self._module.module_intree(path,
-                                                    fallback_outoftree=True)
-            except ImportError as exc:
-                _log_failed_included_module(self.name, path,
-                                            message=_format_exc(exc))
-                continue
-            if module:
-                yield _ModuleDocSpec(module.filepath, self.out_parentdirpath,
-                                     parent=self)
-            else:
-                _log_failed_included_module(self.name, path,
-                                            message='cannot find module')
+        if self._included_modules_docspecs is None:
+            docspecs = []
+            for path in self.included_modules_paths:
+                try:
+                    module = self._module.module_intree(path,
+                                                        fallback_outoftree=
+                                                            True)
+                except ImportError as exc:
+                    _log_failed_included_module(self.name, path,
+                                                message=_format_exc(exc))
+                    continue
+                if module:
+                    docspecs.append(_ModuleDocSpec(module.filepath,
+                                                   self.out_parentdirpath,
+                                                   parent=self))
+                else:
+                    _log_failed_included_module(self.name, path,
+                                                message='cannot find module')
+            self._included_modules_docspecs = docspecs
+        return self._included_modules_docspecs
 
     @property
     def included_modules_paths(self):
         if self._included_modules_paths is None:
-            self._included_modules_paths = \
-                self._module.included_modules_paths(toabs=True)
+            try:
+                self._included_modules_paths = \
+                    self.root.known_included_modules_paths[self.src_filepath]
+            except KeyError:
+                self._included_modules_paths = \
+                    self._module.included_modules_paths(toabs=True)
         return self._included_modules_paths
 
     @property
     def isproject(self):
         return False
 
+    @property
+    def known_included_modules_paths(self):
+        # the included modules' paths if they have been determined, without
+        # determining them otherwise
+        return self._included_modules_paths
+
     def module_attr(self, name):
         return self._module.attr(name)
 
     @property
     def module_attrnames(self):
-        return self._module.attrnames
+        if self._module_attrnames is None:
+            self._module_attrnames = frozenset(self._module.attrnames)
+        return self._module_attrnames
 
     @property
     def module_isprivate(self):
-        return self._module.isprivate
+        if self._module_isprivate is None:
+            self._module_isprivate = self._module.isprivate
+        return self._module_isprivate
 
     @property
     def module_isstandard(self):
-        return self._module.isstandard
+        if self._module_isstandard is None:
+            self._module_isstandard = self._module.isstandard
+        return self._module_isstandard
 
     @property
     def name(self):
@@ -814,6 +1049,7 @@ class _ProjectDocSpec(_DocSpec):
         self._docstring = None
         self._excluded_modules_names = []
         self._interesting_descendants = None
+        self._known_included_modules_paths = {}
         self._sphinx_settings_ = None
         self._src_dirnames = src_dirnames
         self._top_interesting_descendants = None
@@ -844,10 +1080,10 @@ class _ProjectDocSpec(_DocSpec):
     def docstring(self):
         if self._docstring is None:
             self._docstring = ''
+            shortname = self.shortname
+            modules_names = (shortname, 'spruce.{}'.format(shortname))
             for descendant in self.top_interesting_descendants:
-                if (descendant.name == self.shortname
-                    or descendant.name
-                       == 'spruce.{}'.format(self.shortname)):
+                if descendant.name in modules_names:
                     # ???: is there a better way to do this
                     #     try/except/log/skip?
                     try:
@@ -874,37 +1110,42 @@ class _ProjectDocSpec(_DocSpec):
     @property
     def interesting_descendants(self):
         if self._interesting_descendants is None:
-            descendants = []
-            for descendant in self.descendants:
-                if self._descendant_is_interesting(descendant):
-                    descendants.append(descendant)
-                descendants.extend(descendant.interesting_descendants)
-            self._interesting_descendants = descendants
+            # descendants already covers the whole tree
+            is_interesting = self._descendant_is_interesting
+            self._interesting_descendants = \
+                [descendant for descendant in self.descendants
+                 if is_interesting(descendant)]
         return self._interesting_descendants
 
     @property
     def isproject(self):
         return True
 
+    @property
+    def known_included_modules_paths(self):
+        return self._known_included_modules_paths
+
     @property
     def name(self):
         return self._sphinx_settings['project']
 
     @property
     def shortdoc(self):
-        blocks = _pprint.split_blocks(self.docstring)
-        if blocks:
-            return blocks[0]
-        else:
-            return ''
+        # only the first block is needed, so cut the docstring at the first
+        # blank line instead of splitting all of it into blocks
+        text = self.docstring.strip()
+        match = _BLANK_LINE_RE.search(text)
+        if match:
+            text = text[:match.start()]
+        return _pprint.strip_and_cleanjoin(*text.split('\n'))
 
     @property
     def shortname(self):
-        strippable_prefix = 'spruce-'
-        if self.name.startswith(strippable_prefix):
-            return self.name[len(strippable_prefix):]
+        name = self.name
+        if name.startswith(_PROJECT_NAME_STRIPPABLE_PREFIX):
+            return name[len(_PROJECT_NAME_STRIPPABLE_PREFIX):]
         else:
-            return self.name
+            return name
 
     @property
     def src_dirnames(self):
@@ -923,16 +1164,25 @@ class _ProjectDocSpec(_DocSpec):
         return self._top_interesting_descendants
 
     def _descendant_is_interesting(self, descendant):
-        return descendant.name != 'nisavid'
+        return descendant.name not in _UNINTERESTING_MODULES_NAMES
 
     @property
     def _sphinx_settings(self):
         if self._sphinx_settings_ is None:
-            sphinx_conf = _os.path.join(self.out_parentdirpath, 'conf.py')
-            if not _os.path.exists(sphinx_conf):
+            sphinx_conf = \
+                _os.path.abspath(_os.path.join(self.out_parentdirpath,
+                                               'conf.py'))
+            try:
+                sphinx_conf_mtime = _os.stat(sphinx_conf).st_mtime
+            except OSError:
                 raise _CriticalError('no Sphinx config found at {!r}'
                                       .format(sphinx_conf))
-            self._sphinx_settings_ = _runpy.run_path(sphinx_conf)
+            key = (sphinx_conf, sphinx_conf_mtime)
+            try:
+                self._sphinx_settings_ = _sphinx_settings_cache[key]
+            except KeyError:
+                self._sphinx_settings_ = _sphinx_settings_cache[key] = \
+                    _runpy.run_path(sphinx_conf)
         return self._sphinx_settings_
 
 
@@ -944,9 +1194,80 @@ class _CriticalError(RuntimeError):
 _logger = _logging.getLogger('project-doc-rest-gen')
 
 
+_debug_enabled = False
+
+
+_info_enabled = False
+
+
+_parts_failed = False
+
+
+_BUILTIN_NAMES = frozenset(dir(_builtins))
+
+
+_BLANK_LINE_RE = _re.compile(r'\n\s*\n')
+
+
+_AUTODOC_MEMBERS_DIRECTIVES = frozenset(('automodule', 'autoclass',
+                                         'autoexception'))
+
+
+_AUTODOC_MEMBERS_FLAGS_LINES = ('   :members:',
+                                '   :undoc-members:',
+                                '   :inherited-members:',
+                                )
+
+
+_module_path_isstandard = _memoized(_introspect.module_path_isstandard)
+
+
+_DIRECTIVES_BY_METATYPE = {_introspect.Metatype.OLDSTYLE: 'autodata',
+                           _introspect.Metatype.FUNCTION: 'autofunction',
+                           _introspect.Metatype.CLASS: 'autoclass',
+                           _introspect.Metatype.EXCEPTION: 'autoexception',
+                           }
+
+
+_LIBS_DISTS_NAMES = ('spruce-introspect', 'spruce-pprint')
+
+
+_MANIFEST_FILENAME = '.doc_gen_rest.json'
+
+
+_PROJECT_NAME_STRIPPABLE_PREFIX = 'spruce-'
+
+
+_UNINTERESTING_MODULES_NAMES = frozenset(('nisavid',))
+
+
+_REST_HEADING_CHARS = ('#', '*', '=', '-', '^', '"')
+
+
+_REST_FILE_HEADER_LINES = ('.. highlight:: python',
+                           '   :linenothreshold: 5',
+                           '',
+                           )
+
+
 _LOGGING_FORMAT = '%(levelname)s: %(message)s'
 
 
+_worker_project_docspec = None
+
+
+# long enough for any run; see _generate_project_rests
+_POOL_RESULTS_TIMEOUT = 7 * 24 * 60 * 60
+
+
+# Sphinx settings by config file path and modification time
+_sphinx_settings_cache = {}
+
+
+# on Python 2, os.rename replaces the destination atomically on POSIX
+_replace_file = getattr(_os, 'replace', _os.rename)
+
+
 _LOGLEVELS_BY_ARGVALUE = {'critical': _logging.CRITICAL,
                           'error': _logging.ERROR,
                           'warning': _logging.WARNING,
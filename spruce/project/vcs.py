@@ -3,28 +3,45 @@
 __copyright__ = "Copyright (C) 2014 Ivan D Vasin"
 __docformat__ = "restructuredtext"
 
+import functools as _functools
 import os as _os
-from pipes import quote as _shquote
-import subprocess as _subprocess
+import re as _re
+import sys as _sys
 
+# the modules that are needed only to run commands are imported when they
+# are first needed, so that importing this module stays cheap for callers
+# that only detect the VCS
 
-def git_topdir(project_path='.'):
-    testpath = _os.path.abspath(project_path)
-    while True:
-        if _os.path.isdir(_os.path.join(testpath, '.git')):
-            return testpath
 
-        if testpath == '/':
-            break
+def _memoized_by_realpath(func):
+
+    cache = {}
+
+    @_functools.wraps(func)
+    def memoized_func(project_path='.'):
+        project_path = _os.path.realpath(project_path)
+        try:
+            return cache[project_path]
+        except KeyError:
+            value = cache[project_path] = func(project_path)
+            return value
 
-        testpath, _ = _os.path.split(testpath)
-    return None
+    memoized_func.cache_clear = cache.clear
+    return memoized_func
+
+
+def git_topdir(project_path='.'):
+    return _detect_vcs(project_path)[1]
 
 
 def guess_vcs(project_path='.'):
 
     """Guess the VCS that is used by a particular project.
 
+    Results are cached by the real path of *project_path*, together with
+    those of :func:`git_topdir`.  Call :func:`guess_vcs.cache_clear` to
+    forget them, for example after creating or removing a working copy.
+
     :param str project_path:
         A file path to a project.
 
@@ -36,16 +53,7 @@ def guess_vcs(project_path='.'):
 
     """
 
-    if _os.path.isdir(project_path + '/.svn'):
-        return 'svn'
-
-    project_git_topdir = git_topdir(project_path)
-    if project_git_topdir is not None:
-        if _os.path.isdir(project_git_topdir + '/.git/svn'):
-            return 'git-svn'
-        return 'git'
-
-    return None
+    return _detect_vcs(project_path)[0]
 
 
 def svn_last_changed_revision(project_path='.'):
@@ -78,36 +86,156 @@ def svn_last_changed_revision(project_path='.'):
     else:
         assert False
 
-    cmdargs = svn_cmdargs + ('info',)
-    svn_proc = _subprocess.Popen(cmdargs, stdout=_subprocess.PIPE)
-    grep_proc = _subprocess.Popen(('grep', 'Last Changed Rev'),
-                                  stdin=svn_proc.stdout,
-                                  stdout=_subprocess.PIPE)
-    sed_proc = _subprocess.Popen(('sed', 's/[^0-9]//g'),
-                                 stdin=grep_proc.stdout,
-                                 stdout=_subprocess.PIPE)
-    proc_output = sed_proc.communicate()[0]
-    revision_str = proc_output.strip()
-
-    # handle missing "Last Changed Rev"
-    #     this is known to happen with git-svn before the project's second
-    #     commit
-    if revision_str == '':
+    revision_str = None
+
+    # ask Subversion 1.9+ for the revision alone
+    #     git-svn has no equivalent
+    if vcs == 'svn':
+        cmdargs = svn_cmdargs + ('info', '--show-item',
+                                 'last-changed-revision')
+        returncode, proc_output = _run_cmd(cmdargs, cwd=project_path,
+                                           discard_stderr=True)
+        if returncode == 0:
+            revision_str = proc_output.strip()
+
+    if not revision_str:
+        cmdargs = svn_cmdargs + ('info',)
+        proc_output = _run_cmd(cmdargs, cwd=project_path)[1]
+        match = _LAST_CHANGED_REV_RE.search(proc_output)
+        if match:
+            revision_str = match.group(1)
+
+    if not revision_str:
+        # handle missing "Last Changed Rev"
+        #     this is known to happen with git-svn before the project's
+        #     second commit
         cmdargs = svn_cmdargs + ('log', '--incremental', '--limit', '1')
-        svn_proc = _subprocess.Popen(cmdargs, stdout=_subprocess.PIPE)
-        proc_output = svn_proc.communicate()[0]
+        proc_output = _run_cmd(cmdargs, cwd=project_path)[1]
         revision_str = proc_output.split()[1][1:]
 
     try:
         revision = int(revision_str)
     except ValueError:
         raise Error('invalid Subversion revision {!r} from `{}`'
-                     .format(revision_str,
-                             ' '.join(_shquote(arg) for arg in cmdargs)))
+                     .format(revision_str, _format_cmd(cmdargs)))
 
     return revision
 
 
+def svn_last_changed_revisions(project_paths):
+
+    """
+    The last Subversion revisions in which some projects were changed.
+
+    This is equivalent to calling :func:`svn_last_changed_revision` for
+    each project, except that the Subversion working copies among them
+    are queried together with a single :command:`svn info`, and the rest
+    are queried concurrently as by
+    :func:`svn_last_changed_revisions_parallel`.
+
+    :param project_paths:
+        File paths to projects.
+    :type project_paths: ~[:obj:`str`]
+
+    :return:
+        The last changed revision of each project, by its path in
+        *project_paths*.
+    :rtype: {:obj:`str`: :obj:`int`}
+
+    :raise IncompatibleVcsError:
+        Raised if the VCS of any of the projects is not Subversion or
+        git-svn.
+
+    """
+
+    project_paths = list(project_paths)
+
+    svn_paths = [path for path in project_paths if guess_vcs(path) == 'svn']
+    revisions_by_abspath = {}
+    if len(svn_paths) > 1:
+        # with more than one target, svn prints each item left-justified in
+        # ten columns, followed by a space and the target
+        cmdargs = ('svn', 'info', '--show-item', 'last-changed-revision') \
+                  + tuple(_os.path.abspath(path) for path in svn_paths)
+        proc_output = _run_cmd(cmdargs, discard_stderr=True)[1]
+        if not isinstance(proc_output, str):
+            proc_output = \
+                proc_output.decode(_sys.getfilesystemencoding())
+        for line in proc_output.splitlines():
+            revision_str = line[:10].strip()
+            if revision_str.isdigit():
+                revisions_by_abspath[_os.path.abspath(line[11:])] = \
+                    int(revision_str)
+
+    revisions = {}
+    remaining_paths = []
+    for path in project_paths:
+        try:
+            revisions[path] = revisions_by_abspath[_os.path.abspath(path)]
+        except KeyError:
+            remaining_paths.append(path)
+
+    # query the rest, including any working copies that the batch missed,
+    # separately
+    if remaining_paths:
+        revisions.update(svn_last_changed_revisions_parallel(remaining_paths))
+
+    return revisions
+
+
+def svn_last_changed_revisions_parallel(project_paths, workers=None):
+
+    """
+    The last Subversion revisions in which some projects were changed,
+    queried concurrently.
+
+    This calls :func:`svn_last_changed_revision` for each project in a
+    pool of threads.  The time is spent waiting on :command:`svn` and
+    :command:`git svn` processes, so threads are enough to overlap them.
+
+    :param project_paths:
+        File paths to projects.
+    :type project_paths: ~[:obj:`str`]
+
+    :param workers:
+        The number of threads.  By default, twice the number of CPUs, up
+        to eight.
+    :type workers: :obj:`int` or null
+
+    :return:
+        The last changed revision of each project, by its path in
+        *project_paths*.
+    :rtype: {:obj:`str`: :obj:`int`}
+
+    :raise IncompatibleVcsError:
+        Raised if the VCS of any of the projects is not Subversion or
+        git-svn.
+
+    """
+
+    import multiprocessing as _multiprocessing
+    from multiprocessing.pool import ThreadPool as _ThreadPool
+
+    project_paths = list(project_paths)
+
+    if workers is None:
+        workers = min(8, _multiprocessing.cpu_count() * 2)
+    workers = min(workers, len(project_paths))
+
+    if workers <= 1:
+        revisions = [svn_last_changed_revision(path)
+                     for path in project_paths]
+    else:
+        pool = _ThreadPool(workers)
+        try:
+            revisions = pool.map(svn_last_changed_revision, project_paths)
+        finally:
+            pool.close()
+            pool.join()
+
+    return dict(zip(project_paths, revisions))
+
+
 SYSTEMS = ('git', 'git-svn', 'svn')
 """The known version control systems.
 
@@ -125,8 +253,64 @@ def vcs_name(vcs):
     :rtype: :obj:`str`
 
     """
-    vcs_names = {'git': 'Git', 'git-svn': 'git-svn', 'svn': 'Subversion'}
-    return vcs_names[vcs]
+    return _VCS_NAMES[vcs]
+
+
+@_memoized_by_realpath
+def _detect_vcs(project_path):
+
+    # find the VCS and the Git top directory in one walk up the tree
+
+    if _os.path.isdir(_os.path.join(project_path, '.svn')):
+        vcs = 'svn'
+    else:
+        vcs = None
+
+    testpath = project_path
+    while True:
+        git_dirpath = _os.path.join(testpath, '.git')
+        if _os.path.isdir(git_dirpath):
+            if vcs is None:
+                if _os.path.isdir(_os.path.join(git_dirpath, 'svn')):
+                    vcs = 'git-svn'
+                else:
+                    vcs = 'git'
+            return vcs, testpath
+
+        parentpath = _os.path.dirname(testpath)
+        if parentpath == testpath:
+            return vcs, None
+        testpath = parentpath
+
+
+def _format_cmd(cmdargs):
+    try:
+        from shlex import quote as _shquote
+    except ImportError:
+        from pipes import quote as _shquote
+    return ' '.join(_shquote(arg) for arg in cmdargs)
+
+
+def _run_cmd(cmdargs, cwd=None, discard_stderr=False):
+
+    # run in the C locale, so that the field labels that are parsed from
+    # the output are not translated
+
+    import subprocess as _subprocess
+
+    env = dict(_os.environ, LC_ALL='C')
+    stderr = open(_os.devnull, 'wb') if discard_stderr else None
+    try:
+        proc = _subprocess.Popen(cmdargs, cwd=cwd, env=env,
+                                 stdout=_subprocess.PIPE, stderr=stderr)
+        output = proc.communicate()[0]
+    finally:
+        if stderr is not None:
+            stderr.close()
+    return proc.returncode, output
+
+
+git_topdir.cache_clear = guess_vcs.cache_clear = _detect_vcs.cache_clear
 
 
 class Error(RuntimeError):
@@ -156,3 +340,10 @@ class IncompatibleVcsError(Error):
             message = 'incompatible VCS {!r}; compatible systems are [{}]'\
                        .format(vcs, compatible_systems_str)
         super(IncompatibleVcsError, self).__init__(message)
+
+
+_LAST_CHANGED_REV_RE = _re.compile(br'^Last Changed Rev:\s*(\d+)',
+                                   _re.MULTILINE)
+
+
+_VCS_NAMES = {'git': 'Git', 'git-svn': 'git-svn', 'svn': 'Subversion'}